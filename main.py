@@ -3,6 +3,7 @@ from src.config import Config
 from src.data_processor import DataProcessor
 from src.sampler import Sampler
 from src.visualizer import Visualizer
+from src.memory_monitor import MemoryMonitor
 
 
 def main():
@@ -12,19 +13,27 @@ def main():
 
     Config.print_config()
     start_total = time.time()
+    monitor = MemoryMonitor(Config)
 
     # --------------------------
     # 1. 数据加载与处理
     # --------------------------
-    processor = DataProcessor(Config)
+    processor = DataProcessor(Config, monitor=monitor)
     buildings, roads = processor.run()
 
     # --------------------------
     # 2. 核心采样
     # --------------------------
-    sampler = Sampler(Config)
-    midpoints = sampler.generate_building_midpoints(buildings)
-    raw_results = sampler.execute_sampling(buildings, roads, midpoints)
+    sampler = Sampler(Config, monitor=monitor)
+    with monitor.stage("计算边中点"):
+        midpoints = sampler.generate_building_midpoints(buildings)
+    monitor.track("边中点", midpoints)
+    if Config.BACKFACE_CULLING_ENABLED:
+        with monitor.stage("背面剔除"):
+            midpoints = sampler.cull_backfacing_midpoints(buildings, roads, midpoints)
+    with monitor.stage("采样匹配"):
+        raw_results = sampler.execute_sampling(buildings, roads, midpoints)
+    monitor.track("采样结果", raw_results)
 
     if raw_results.empty:
         print("错误：未生成任何有效采样点，程序终止。")
@@ -36,7 +45,8 @@ def main():
     viz = Visualizer(Config)
 
     # 3.1 导出 CSV
-    final_df = viz.save_results_to_csv(raw_results, "facade_points.csv")
+    with monitor.stage("导出结果"):
+        final_df = viz.save_results_to_csv(raw_results, "facade_points.csv")
 
     # 3.2 基础可视化
     viz.create_interactive_map(final_df, "preview_map.html")
@@ -47,11 +57,12 @@ def main():
 
     # 3.4 绘制采样详情图
     # 注意：raw_results 包含了 geometry 对象，适合用于绘图
-    viz.plot_detailed_samples(raw_results, buildings, roads)
+    viz.plot_detailed_samples(raw_results, buildings, roads, cache=sampler.cache)
 
     # --------------------------
     # 结束
     # --------------------------
+    monitor.print_report()
     elapsed = time.time() - start_total
     print("\n" + "=" * 50)
     print(f"全部任务完成！总耗时: {elapsed:.2f} 秒")
@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import pandas as pd
+import shapely
+from .config import Config
+
+# 影响采样结果的配置项，任一变化都会使已有检查点失效
+FINGERPRINT_KEYS = [
+    'BUILDING_PATH', 'ROAD_PATH', 'TARGET_CRS',
+    'SAMPLE_SIZE', 'RANDOM_SEED', 'SIMPLIFY_TOLERANCE', 'MIN_BUILDING_AREA',
+    'BUFFER_DISTANCE', 'MAX_DISTANCE', 'BACKFACE_CULLING_ENABLED',
+    'MATCH_MODE', 'ROAD_FILTER_ENABLED', 'ROAD_TYPE_COLUMN', 'EXCLUDED_ROAD_TYPES',
+    'ROAD_CLASS_PENALTIES', 'ROAD_CLASS_DEFAULT_PENALTY',
+]
+# 几何 WKB 分片参与哈希时每片的几何数，避免一次性拼接出与几何同等大小的字节串
+FINGERPRINT_WKB_CHUNK = 100000
+
+
+class CheckpointManager:
+    """
+    采样检查点管理
+    按建筑位置区间 [start, end) 分批落盘结果，并用 manifest 记录已完成的区间，
+    中断后以相同输入和配置重启即可跳过已完成的批次
+    """
+    MANIFEST_NAME = "manifest.json"
+
+    def __init__(self, config=Config, fingerprint="", batch_size=None):
+        self.cfg = config
+        self.checkpoint_dir = config.CHECKPOINT_DIR
+        self.fingerprint = fingerprint
+        # 仅对新建的 manifest 生效；续跑时沿用 manifest 中记录的批次大小
+        self.initial_batch_size = batch_size or config.CHECKPOINT_BATCH_SIZE
+        self.manifest = self._load_manifest()
+
+    @staticmethod
+    def compute_fingerprint(config, buildings_gdf, roads_gdf, midpoints_gdf):
+        """根据配置与输入数据计算指纹，用于判断检查点是否可复用"""
+        h = hashlib.sha256()
+        params = {key: getattr(config, key, None) for key in FINGERPRINT_KEYS}
+        h.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+
+        # 建筑 ID 顺序决定批次区间的含义，必须完全一致
+        h.update(pd.util.hash_pandas_object(buildings_gdf['building_id'], index=False).values.tobytes())
+
+        # 几何按 WKB 逐字节参与哈希：道路改动但范围和条数不变时也能识别
+        for gdf in (buildings_gdf, roads_gdf, midpoints_gdf):
+            geoms = gdf.geometry.values
+            h.update(str(len(geoms)).encode('utf-8'))
+            for i in range(0, len(geoms), FINGERPRINT_WKB_CHUNK):
+                h.update(b''.join(shapely.to_wkb(geoms[i:i + FINGERPRINT_WKB_CHUNK], hex=False)))
+
+        # 道路类型决定道路等级惩罚，类型被重新标注时检查点也必须失效
+        for col in (config.ROAD_TYPE_COLUMN, 'road_class'):
+            if col in roads_gdf.columns:
+                h.update(pd.util.hash_pandas_object(roads_gdf[col].astype(str), index=False).values.tobytes())
+        h.update(pd.util.hash_pandas_object(midpoints_gdf['edge_index'], index=False).values.tobytes())
+        return h.hexdigest()
+
+    @property
+    def batch_size(self):
+        return self.manifest['batch_size']
+
+    def _manifest_path(self):
+        return os.path.join(self.checkpoint_dir, self.MANIFEST_NAME)
+
+    def _new_manifest(self):
+        return {
+            'fingerprint': self.fingerprint,
+            'batch_size': self.initial_batch_size,
+            'batches': []
+        }
+
+    def _load_manifest(self):
+        """读取已有 manifest，指纹不一致时清理旧批次并重新开始"""
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        path = self._manifest_path()
+        if not os.path.exists(path):
+            return self._new_manifest()
+
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        if manifest.get('fingerprint') != self.fingerprint:
+            print("  检查点与当前输入/配置不一致，忽略旧检查点重新开始")
+            for batch in manifest.get('batches', []):
+                batch_path = os.path.join(self.checkpoint_dir, batch['file'])
+                if os.path.exists(batch_path):
+                    os.remove(batch_path)
+            manifest = self._new_manifest()
+            self._write_manifest(manifest)
+            return manifest
+
+        done = sum(b['end'] - b['start'] for b in manifest['batches'])
+        print(f"  发现检查点: 已完成 {len(manifest['batches'])} 个批次 ({done} 个建筑)，将从断点继续")
+        return manifest
+
+    @staticmethod
+    def _fsync_replace(tmp_path, final_path):
+        """刷盘后原子替换，保证中断时不会留下半写入的文件"""
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, final_path)
+
+    def _write_manifest(self, manifest):
+        path = self._manifest_path()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        self._fsync_replace(tmp_path, path)
+
+    def is_completed(self, start, end):
+        """判断建筑区间 [start, end) 是否已完成"""
+        return any(b['start'] == start and b['end'] == end for b in self.manifest['batches'])
+
+    def save_batch(self, start, end, batch_results):
+        """将一个批次的采样结果落盘，并在 manifest 中登记"""
+        filename = f"batch_{start:09d}_{end:09d}.pkl"
+        path = os.path.join(self.checkpoint_dir, filename)
+        tmp_path = path + ".tmp"
+        pd.DataFrame(batch_results).to_pickle(tmp_path)
+        self._fsync_replace(tmp_path, path)
+
+        # 结果文件写完后才登记，manifest 中的批次一定可读
+        self.manifest['batches'].append({
+            'start': start, 'end': end, 'file': filename, 'count': len(batch_results)
+        })
+        self._write_manifest(self.manifest)
+
+    def load_results(self):
+        """按建筑区间顺序合并所有批次结果"""
+        batches = sorted(self.manifest['batches'], key=lambda b: b['start'])
+        frames = [pd.read_pickle(os.path.join(self.checkpoint_dir, b['file'])) for b in batches if b['count'] > 0]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
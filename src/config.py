@@ -32,6 +32,33 @@ class Config:
     # ==========================
     BUFFER_DISTANCE = 50  # 搜索缓冲区（米）
     MAX_DISTANCE = 100  # 最大有效距离（米）
+    BACKFACE_CULLING_ENABLED = False  # 剔除背向所有道路的建筑边（如街区内侧背墙），开启后会改变采样结果
+
+    # ==========================
+    # 匹配模式参数
+    # ==========================
+    # 'exact': 精确几何最近点；'raster': 栅格化道路距离场近似匹配（适合城市级探索性运行）
+    MATCH_MODE = 'exact'
+    RASTER_RESOLUTION = 5  # 道路栅格分辨率（米），近似误差约为半个像元
+    RASTER_REFINE = False  # 是否对每个建筑选中的边做精确最近点修正
+    RASTER_ERROR_SAMPLE_SIZE = 200  # 抽样对比精确模式的建筑数量，0 为不对比
+
+    # ==========================
+    # 检查点参数
+    # ==========================
+    # 开启后采样结果按批次落盘，中断后以相同输入和配置重启可从断点继续
+    CHECKPOINT_ENABLED = False
+    CHECKPOINT_DIR = "./data/checkpoint"
+    CHECKPOINT_BATCH_SIZE = 500  # 每批处理的建筑数量
+
+    # ==========================
+    # 内存参数
+    # ==========================
+    # 内存预算（MB），None 为不限制；加载前预估或运行中超出时提前失败并打印内存报告
+    # 仅在开启 CHECKPOINT_ENABLED 时用于选择采样批次大小，否则只会在超出时中止运行
+    MEMORY_BUDGET_MB = None
+    MEMORY_BATCH_FRACTION = 0.5  # 单个采样批次最多占用剩余预算的比例（需开启检查点）
+    MEMORY_SAMPLE_INTERVAL = 0.2  # 阶段内峰值内存的采样间隔（秒）
 
     # ==========================
     # [新增] 道路筛选参数
@@ -53,12 +80,32 @@ class Config:
         'steps'
     ]
 
+    # 道路等级距离惩罚（米）：排序时以 距离 + 惩罚 比较候选点，输出的距离仍为实际距离
+    # 例如服务道路惩罚 5 米时，5 米外的小巷不再优先于 8 米外的主干道
+    ROAD_CLASS_PENALTIES = {
+        'primary': 0,
+        'secondary': 0,
+        'tertiary': 0,
+        'residential': 1,
+        'unclassified': 2,
+        'living_street': 3,
+        'service': 5,
+        'track': 10,
+    }
+    ROAD_CLASS_DEFAULT_PENALTY = 0  # 未列出的道路类型（或缺少类型列）的惩罚
+
     @staticmethod
     def print_config():
         """打印当前关键配置"""
         print("[配置信息]")
         print(f"  - 目标坐标系: {Config.TARGET_CRS}")
         print(f"  - 采样数量: {Config.SAMPLE_SIZE}")
+        print(f"  - 匹配模式: {Config.MATCH_MODE}"
+              + (f" (分辨率 {Config.RASTER_RESOLUTION}m)" if Config.MATCH_MODE == 'raster' else ""))
+        print(f"  - 背面剔除: {'开启' if Config.BACKFACE_CULLING_ENABLED else '关闭'}")
+        print(f"  - 检查点: {Config.CHECKPOINT_DIR if Config.CHECKPOINT_ENABLED else '关闭'}")
+        if Config.MEMORY_BUDGET_MB:
+            print(f"  - 内存预算: {Config.MEMORY_BUDGET_MB} MB")
         print(f"  - 道路筛选: {'开启' if Config.ROAD_FILTER_ENABLED else '关闭'}")
         if Config.ROAD_FILTER_ENABLED:
             print(f"  - 排除类型: {Config.EXCLUDED_ROAD_TYPES}")
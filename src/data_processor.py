@@ -3,14 +3,17 @@ import pandas as pd
 import numpy as np
 from shapely.geometry import MultiPolygon, Polygon
 import warnings
+from contextlib import nullcontext
 from .config import Config
 
 warnings.filterwarnings('ignore')
 
 
 class DataProcessor:
-    def __init__(self, config=Config):
+    def __init__(self, config=Config, monitor=None):
         self.cfg = config
+        # 可选的 MemoryMonitor，用于分阶段统计内存
+        self.monitor = monitor
         self.buildings = None
         self.roads = None
         # 用于存储简化前后的对比样本，供 Visualizer 使用
@@ -62,6 +65,25 @@ class DataProcessor:
             else:
                 print(f"  警告: 未找到道路类型列 '{col_name}'，跳过筛选。")
 
+        # 4. 道路等级编码
+        self.encode_road_classes()
+
+        return self.roads
+
+    def encode_road_classes(self):
+        """
+        将道路类型编码为紧凑的整数列 'road_class'
+        编码为 ROAD_CLASS_PENALTIES 中的顺序，未列出的类型为 -1
+        """
+        categories = list(self.cfg.ROAD_CLASS_PENALTIES.keys())
+        col_name = self.cfg.ROAD_TYPE_COLUMN
+        if col_name in self.roads.columns:
+            codes = pd.Categorical(self.roads[col_name], categories=categories).codes
+        else:
+            codes = np.full(len(self.roads), -1)
+        self.roads['road_class'] = codes.astype(np.int8 if len(categories) < 127 else np.int16)
+
+        print(f"  道路等级编码: {len(categories)} 类，未分类 {(self.roads['road_class'] == -1).sum()} 条")
         return self.roads
 
     def preprocess_buildings(self):
@@ -121,10 +143,26 @@ class DataProcessor:
         self.buildings = self.buildings.reset_index(drop=True)
         return self.buildings
 
+    def _stage(self, name):
+        return self.monitor.stage(name) if self.monitor else nullcontext()
+
     def run(self):
         """执行完整的数据处理流程"""
-        self.load_data()
-        self.preprocess_roads()
-        self.preprocess_buildings()
+        if self.monitor:
+            self.monitor.check_load_budget([self.cfg.BUILDING_PATH, self.cfg.ROAD_PATH])
+        with self._stage("加载数据"):
+            self.load_data()
+        if self.monitor:
+            self.monitor.track("原始建筑", self.buildings)
+            self.monitor.track("原始道路", self.roads)
+
+        with self._stage("处理道路"):
+            self.preprocess_roads()
+        with self._stage("处理建筑"):
+            self.preprocess_buildings()
+        if self.monitor:
+            self.monitor.track("建筑", self.buildings)
+            self.monitor.track("道路", self.roads)
+
         print("\n数据预处理完成")
-        return self.buildings, self.roads
\ No newline at end of file
+        return self.buildings, self.roads
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+from .config import Config
+from .geometry_utils import calculate_polygon_edge_midpoints
+
+# 批量缓冲区查询时每次处理的建筑数量，限制缓冲区几何与查询结果的临时内存
+ROAD_QUERY_CHUNK = 50000
+
+
+def _offsets_from_counts(counts):
+    """由每个建筑的条目数得到 CSR 偏移数组：第 i 个建筑的条目为 [offsets[i], offsets[i+1])"""
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+class GeometryCache:
+    """
+    建筑派生几何的共享索引
+    由 Sampler 创建，背面剔除、采样与 Visualizer 共用，所有结构均为按建筑位置排列的紧凑数组：
+      - building_id -> 行位置 映射（替代对 buildings_gdf 的全表布尔筛选）
+      - 候选道路 CSR：road_offsets (int64, 建筑数 + 1) 与 road_pos (int32, 候选对数)，
+        由一次分块批量缓冲区查询得到，之后不再逐建筑 buffer + sindex 查询
+      - 边中点 CSR：midpoint_offsets 与 midpoint_order（中点已按建筑排列时为 None）
+    大小由建筑数与候选对数决定，可通过 nbytes 交给 MemoryMonitor 统计
+    """
+
+    def __init__(self, buildings_gdf, roads_gdf, config=Config, monitor=None):
+        self.cfg = config
+        self.monitor = monitor
+        self.buildings_gdf = buildings_gdf
+        self.roads_gdf = roads_gdf
+
+        self.building_index = pd.Series(np.arange(len(buildings_gdf)), index=buildings_gdf['building_id'].values)
+
+        self.road_offsets = None
+        self.road_pos = None
+        self.midpoints_gdf = None
+        self.midpoint_offsets = None
+        self.midpoint_order = None
+
+    @property
+    def nbytes(self):
+        arrays = (self.road_offsets, self.road_pos, self.midpoint_offsets, self.midpoint_order)
+        return int(self.building_index.memory_usage(index=True)) + sum(a.nbytes for a in arrays if a is not None)
+
+    def positions_of(self, building_ids):
+        """批量将 building_id 转为行位置"""
+        return self.building_index.reindex(building_ids).to_numpy(dtype=np.int64)
+
+    def build_road_candidates(self):
+        """按建筑位置分块批量查询 BUFFER_DISTANCE 缓冲区内的道路，生成候选道路 CSR"""
+        if self.road_pos is not None:
+            return
+
+        n = len(self.buildings_gdf)
+        counts = np.zeros(n, dtype=np.int64)
+        road_chunks = []
+        for start in range(0, n, ROAD_QUERY_CHUNK):
+            end = min(start + ROAD_QUERY_CHUNK, n)
+            buffers = self.buildings_gdf.geometry.iloc[start:end].buffer(self.cfg.BUFFER_DISTANCE)
+            b_pos, r_pos = self.roads_gdf.sindex.query(buffers, predicate='intersects')
+
+            order = np.argsort(b_pos, kind='stable')
+            road_chunks.append(r_pos[order].astype(np.int32))
+            counts[start:end] = np.bincount(b_pos, minlength=end - start)
+            if self.monitor:
+                self.monitor.check_budget(f"候选道路查询 [{start}, {end})")
+
+        self.road_pos = np.concatenate(road_chunks) if road_chunks else np.empty(0, dtype=np.int32)
+        self.road_offsets = _offsets_from_counts(counts)
+
+    def set_midpoints(self, midpoints_gdf):
+        """登记（可能已经过背面剔除的）边中点，并建立按建筑的 CSR 索引"""
+        self.midpoints_gdf = midpoints_gdf
+        b_pos = self.positions_of(midpoints_gdf['building_id'].values)
+        self.midpoint_offsets = _offsets_from_counts(np.bincount(b_pos, minlength=len(self.buildings_gdf)))
+
+        # generate_building_midpoints 的输出本身按建筑排列，此时无需额外的排序数组
+        if len(b_pos) > 1 and np.any(b_pos[1:] < b_pos[:-1]):
+            self.midpoint_order = np.argsort(b_pos, kind='stable')
+        else:
+            self.midpoint_order = None
+
+    def get_building(self, building_id):
+        """按 building_id 取建筑行"""
+        return self.buildings_gdf.iloc[self.building_index[building_id]]
+
+    def get_geometry(self, building_id):
+        return self.get_building(building_id).geometry
+
+    def get_midpoints(self, building_id):
+        """
+        取建筑的候选边中点 (DataFrame，含 'midpoint' 与 'edge_index' 列)
+        已登记 midpoints_gdf 时从 CSR 切片，否则由建筑几何现算
+        """
+        if self.midpoints_gdf is None:
+            return pd.DataFrame(calculate_polygon_edge_midpoints(self.get_geometry(building_id)))
+
+        pos = self.building_index[building_id]
+        start, end = self.midpoint_offsets[pos], self.midpoint_offsets[pos + 1]
+        rows = slice(start, end) if self.midpoint_order is None else self.midpoint_order[start:end]
+        return self.midpoints_gdf.iloc[rows]
+
+    def get_road_candidates(self, building_id):
+        """
+        取建筑 BUFFER_DISTANCE 缓冲区内的道路位置（roads_gdf 的 iloc 下标）
+        已建立候选道路 CSR 时直接切片；否则（如近似模式）单独查询该建筑
+        """
+        pos = self.building_index[building_id]
+        if self.road_pos is not None:
+            return self.road_pos[self.road_offsets[pos]:self.road_offsets[pos + 1]]
+
+        buffer = self.buildings_gdf.geometry.iloc[pos].buffer(self.cfg.BUFFER_DISTANCE)
+        return np.asarray(self.roads_gdf.sindex.query(buffer, predicate='intersects'))
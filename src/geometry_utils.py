@@ -1,17 +1,19 @@
 import numpy as np
+import shapely
 from shapely.geometry import Point, MultiPolygon, Polygon
 
 
 def calculate_polygon_edge_midpoints(geometry, start_edge_index=0):
     """
-    计算多边形各边的中点
+    计算多边形各边的中点及其外法向量
 
     Args:
         geometry: Shapely Polygon or MultiPolygon
         start_edge_index: 起始的边索引编号
 
     Returns:
-        list of dict: [{'edge_index': int, 'midpoint': Point}, ...]
+        list of dict: [{'edge_index': int, 'midpoint': Point, 'normal_x': float, 'normal_y': float,
+                        'edge_length': float}, ...]
     """
     midpoints = []
     current_edge_idx = start_edge_index
@@ -24,25 +26,104 @@ def calculate_polygon_edge_midpoints(geometry, start_edge_index=0):
 
     for poly in polys:
         # 获取外环坐标
-        coords = list(poly.exterior.coords)
-        # 遍历每一条边 (点i -> 点i+1)
-        for i in range(len(coords) - 1):
-            p1 = coords[i]
-            p2 = coords[i + 1]
-
-            # 计算中点坐标
-            mid_x = (p1[0] + p2[0]) / 2.0
-            mid_y = (p1[1] + p2[1]) / 2.0
-
+        coords = np.asarray(poly.exterior.coords)[:, :2]
+        if len(coords) < 2:
+            continue
+
+        # 边 (点i -> 点i+1) 的中点与方向向量
+        p1 = coords[:-1]
+        p2 = coords[1:]
+        mids = (p1 + p2) / 2.0
+        lengths = np.hypot(p2[:, 0] - p1[:, 0], p2[:, 1] - p1[:, 1])
+        normals = calculate_ring_outward_normals(coords)
+
+        for i in range(len(mids)):
             midpoints.append({
                 'edge_index': current_edge_idx,
-                'midpoint': Point(mid_x, mid_y)
+                'midpoint': Point(mids[i, 0], mids[i, 1]),
+                'normal_x': normals[i, 0],
+                'normal_y': normals[i, 1],
+                'edge_length': lengths[i]
             })
             current_edge_idx += 1
 
     return midpoints
 
 
+def calculate_ring_outward_normals(coords):
+    """
+    根据环的走向（顺/逆时针）计算每条边的单位外法向量
+
+    Args:
+        coords: (N, 2) 闭合环坐标数组，首尾点相同
+
+    Returns:
+        np.ndarray: (N-1, 2) 单位外法向量，退化边（长度为0）为 (0, 0)，背面剔除时总会被剔除
+    """
+    coords = np.asarray(coords, dtype=float)
+    d = coords[1:] - coords[:-1]
+
+    # 鞋带公式求有向面积：> 0 为逆时针，外侧在边的右手方向
+    signed_area = np.sum(coords[:-1, 0] * coords[1:, 1] - coords[1:, 0] * coords[:-1, 1]) / 2.0
+    if signed_area >= 0:
+        normals = np.column_stack([d[:, 1], -d[:, 0]])
+    else:
+        normals = np.column_stack([-d[:, 1], d[:, 0]])
+
+    lengths = np.hypot(normals[:, 0], normals[:, 1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        normals = np.where(lengths[:, None] > 0, normals / lengths[:, None], 0.0)
+    return normals
+
+
+def calculate_edge_midpoints_array(geometries):
+    """
+    calculate_polygon_edge_midpoints 的向量化版本：一次性计算一组多边形外环各边的中点、外法向与边长
+
+    Args:
+        geometries: Polygon / MultiPolygon 数组
+
+    Returns:
+        dict of np.ndarray: 'geom_index'（所属几何的位置）, 'edge_index'（几何内从 0 开始的边编号）,
+        'x', 'y'（中点坐标）, 'normal_x', 'normal_y'（单位外法向）, 'edge_length'
+    """
+    parts, part_geom = shapely.get_parts(np.asarray(geometries), return_index=True)
+    rings = shapely.get_exterior_ring(parts)
+    coords, ring_idx = shapely.get_coordinates(rings, return_index=True)
+
+    # 相邻坐标属于同一个环时构成一条边
+    same = ring_idx[1:] == ring_idx[:-1]
+    p1 = coords[:-1][same]
+    p2 = coords[1:][same]
+    edge_ring = ring_idx[:-1][same]
+    d = p2 - p1
+
+    # 逐环鞋带公式求有向面积，决定外法向在边的哪一侧（与 calculate_ring_outward_normals 一致）
+    cross = p1[:, 0] * p2[:, 1] - p2[:, 0] * p1[:, 1]
+    signed_area = np.bincount(edge_ring, weights=cross, minlength=len(rings)) / 2.0
+    side = np.where(signed_area[edge_ring] >= 0, 1.0, -1.0)
+    normals = side[:, None] * np.column_stack([d[:, 1], -d[:, 0]])
+
+    lengths = np.hypot(d[:, 0], d[:, 1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        normals = np.where(lengths[:, None] > 0, normals / lengths[:, None], 0.0)
+
+    # 边按几何顺序排列，几何内编号 = 全局序号 - 该几何第一条边的序号
+    edge_geom = part_geom[edge_ring]
+    edge_index = np.arange(len(edge_geom)) - np.searchsorted(edge_geom, edge_geom)
+
+    mids = (p1 + p2) / 2.0
+    return {
+        'geom_index': edge_geom,
+        'edge_index': edge_index,
+        'x': mids[:, 0],
+        'y': mids[:, 1],
+        'normal_x': normals[:, 0],
+        'normal_y': normals[:, 1],
+        'edge_length': lengths,
+    }
+
+
 def calculate_heading(xs, ys, xc, yc):
     """
     计算从采样点(xs, ys)指向建筑点(xc, yc)的角度（0度为正北）
@@ -87,4 +168,25 @@ def calculate_heading(xs, ys, xc, yc):
     else:
         final_heading = 360 - theta
 
-    return round(final_heading, 2)
\ No newline at end of file
+    return round(final_heading, 2)
+
+
+def calculate_heading_array(xs, ys, xc, yc):
+    """
+    calculate_heading 的向量化版本：批量计算从采样点指向建筑点的角度（0度为正北，顺时针）
+
+    Args:
+        xs, ys: 道路采样点坐标数组 (Source)
+        xc, yc: 建筑目标点坐标数组 (Target)
+
+    Returns:
+        np.ndarray: 角度 (0-360)，采样点与目标点重合时为 0
+    """
+    dx = np.asarray(xc, dtype=float) - np.asarray(xs, dtype=float)
+    dy = np.asarray(yc, dtype=float) - np.asarray(ys, dtype=float)
+
+    # atan2(dx, dy) 即与正北方向的夹角，负值对应左侧 (360 - theta)
+    heading = np.degrees(np.arctan2(dx, dy))
+    heading = np.where(heading < 0, heading + 360, heading)
+    heading = np.where((dx == 0) & (dy == 0), 0.0, heading)
+    return np.round(heading, 2)
@@ -0,0 +1,191 @@
+import os
+import sys
+import threading
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from .config import Config
+
+try:
+    import psutil
+except ImportError:  # psutil 为可选依赖，缺失时退回 /proc 与 resource
+    psutil = None
+
+MB = 1024 ** 2
+# GeoJSON 读入为 GeoDataFrame 后的内存约为文件大小的倍数（含 Shapely 对象与解析开销），用于加载前预估
+GEOJSON_MEMORY_FACTOR = 3
+
+
+def get_rss_bytes():
+    """当前进程常驻内存 (RSS)，无法获取时返回 None"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # ru_maxrss 在 Linux 上单位为 KB，macOS 上为字节；这里只能拿到历史峰值作为近似
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except (ImportError, AttributeError):
+        return None
+
+
+def estimate_nbytes(obj):
+    """
+    估算对象占用的字节数
+    GeoDataFrame/GeoSeries 的几何列在 pandas 中只计指针，这里按坐标数额外估算 Shapely 对象本身
+    """
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        frame = obj.to_frame() if isinstance(obj, pd.Series) else obj
+        total = int(frame.memory_usage(deep=True, index=True).sum())
+        for col in frame.columns:
+            if str(frame[col].dtype) == 'geometry':
+                total += _estimate_geometry_nbytes(frame[col].values)
+        return total
+    if hasattr(obj, 'nbytes'):  # np.ndarray 以及 GeometryCache 等自报大小的对象
+        return int(obj.nbytes)
+    if isinstance(obj, (list, tuple, dict)):
+        return sys.getsizeof(obj) + sum(sys.getsizeof(v) for v in (obj.values() if isinstance(obj, dict) else obj))
+    return sys.getsizeof(obj)
+
+
+def _estimate_geometry_nbytes(geoms):
+    """按 每个几何对象约 100 字节 + 每个坐标 16 字节 估算"""
+    try:
+        import shapely
+        n_coords = int(shapely.get_num_coordinates(np.asarray(geoms)).sum())
+    except (ImportError, AttributeError, TypeError):
+        return 0
+    return len(geoms) * 100 + n_coords * 16
+
+
+def format_mb(n_bytes):
+    return "N/A" if n_bytes is None else f"{n_bytes / MB:,.1f} MB"
+
+
+class MemoryMonitor:
+    """
+    分阶段内存统计
+    每个阶段记录 RSS 增量与阶段内峰值（后台线程定时采样），并登记主要数据对象的估算大小；
+    配置了 MEMORY_BUDGET_MB 时：加载前按文件大小预估、阶段内由采样线程标记超限，
+    在阶段/批次边界以清晰的报告提前失败；开启检查点时还据此选择采样批次大小
+    """
+
+    def __init__(self, config=Config):
+        self.cfg = config
+        self.budget = config.MEMORY_BUDGET_MB * MB if config.MEMORY_BUDGET_MB else None
+        self.interval = config.MEMORY_SAMPLE_INTERVAL
+        self.stages = []
+        self.objects = []
+        # 采样线程观察到的超出预算的 RSS，由主线程在批次/阶段边界检查并抛出
+        self.exceeded_rss = None
+
+    @contextmanager
+    def stage(self, name):
+        """统计一个流水线阶段的内存变化"""
+        rss_before = get_rss_bytes()
+        peak = {'value': rss_before or 0}
+        stop = threading.Event()
+
+        def _poll():
+            while not stop.wait(self.interval):
+                rss = get_rss_bytes()
+                if rss is not None and rss > peak['value']:
+                    peak['value'] = rss
+                if rss is not None and self.budget is not None and rss > self.budget and self.exceeded_rss is None:
+                    self.exceeded_rss = rss
+
+        poller = threading.Thread(target=_poll, daemon=True)
+        poller.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            poller.join()
+
+        rss_after = get_rss_bytes()
+        if rss_after is not None:
+            peak['value'] = max(peak['value'], rss_after)
+        delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        self.stages.append({
+            'stage': name, 'rss_before': rss_before, 'rss_after': rss_after,
+            'delta': delta, 'peak': peak['value'] or None
+        })
+        sign = '+' if delta is not None and delta >= 0 else ''
+        print(f"  [内存] {name}: RSS {format_mb(rss_after)} ({sign}{format_mb(delta)}), 峰值 {format_mb(peak['value'])}")
+        self.check_budget(name)
+
+    def track(self, name, obj):
+        """登记一个主要数据对象的估算大小"""
+        n_bytes = estimate_nbytes(obj)
+        self.objects.append({'name': name, 'bytes': n_bytes})
+        return n_bytes
+
+    def _fail(self, context, rss, extra_bytes=0, label="当前 RSS"):
+        self.print_report()
+        raise MemoryError(
+            f"内存预算不足 ({context}): {label} {format_mb(rss)}"
+            f"{f' + 预计 {format_mb(extra_bytes)}' if extra_bytes else ''}"
+            f" > 预算 {format_mb(self.budget)}。"
+            f"请调大 MEMORY_BUDGET_MB、减小 SAMPLE_SIZE 或开启 CHECKPOINT_ENABLED"
+        )
+
+    def raise_if_exceeded(self, context):
+        """采样线程已观察到超出预算时抛出 MemoryError；只读一个标记，可在逐建筑循环中调用"""
+        if self.exceeded_rss is not None:
+            self._fail(context, self.exceeded_rss, label="阶段内 RSS")
+
+    def check_budget(self, context, extra_bytes=0):
+        """
+        检查当前 RSS（加上预计追加的 extra_bytes）或阶段内观察到的 RSS 是否超出预算，
+        超出则打印报告并抛出 MemoryError
+        """
+        if self.budget is None:
+            return
+        self.raise_if_exceeded(context)
+        rss = get_rss_bytes()
+        if rss is None:
+            return
+        if rss + extra_bytes > self.budget:
+            self._fail(context, rss, extra_bytes)
+
+    def check_load_budget(self, paths):
+        """加载前按输入文件大小预估内存，避免在读取 GeoJSON 途中被系统 OOM 终止"""
+        if self.budget is None:
+            return
+        file_bytes = sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+        self.check_budget("加载数据前预估", extra_bytes=file_bytes * GEOJSON_MEMORY_FACTOR)
+
+    def suggest_batch_size(self, bytes_per_item, default):
+        """
+        根据剩余预算选择批次大小：不超过 default，且一批数据不超过剩余预算的 MEMORY_BATCH_FRACTION
+        """
+        if self.budget is None:
+            return default
+        rss = get_rss_bytes()
+        if rss is None:
+            return default
+        headroom = (self.budget - rss) * self.cfg.MEMORY_BATCH_FRACTION
+        n_items = int(headroom // max(bytes_per_item, 1))
+        if n_items < 1:
+            self.check_budget("选择批次大小", extra_bytes=bytes_per_item)
+            n_items = 1
+        return max(1, min(default, n_items))
+
+    def print_report(self):
+        """打印各阶段内存与主要对象大小汇总"""
+        print("\n[内存报告]")
+        if self.budget is not None:
+            print(f"  - 预算: {format_mb(self.budget)}")
+        for s in self.stages:
+            print(f"  - {s['stage']:<16} RSS {format_mb(s['rss_after']):>12}  "
+                  f"增量 {format_mb(s['delta']):>12}  峰值 {format_mb(s['peak']):>12}")
+        if self.objects:
+            print("  主要数据对象 (估算):")
+            for o in self.objects:
+                print(f"  - {o['name']:<16} {format_mb(o['bytes']):>12}")
+        print("-" * 40)
@@ -0,0 +1,119 @@
+import numpy as np
+from scipy.ndimage import distance_transform_edt
+from .config import Config
+
+
+class RasterRoadMatcher:
+    """
+    栅格化道路距离场（近似匹配模式）
+    将道路网按 RASTER_RESOLUTION 栅格化，通过欧氏距离变换得到每个像元最近的道路像元，
+    之后任意点的最近道路点与距离均可由数组查表得到，无需逐点几何计算。
+    最近道路点取落在该道路像元内的道路采样点，误差约为半个像元；
+    同时记录该点所属道路的位置，供按道路等级排序
+    """
+
+    def __init__(self, roads_gdf, extent, config=Config, monitor=None):
+        """
+        Args:
+            roads_gdf: 投影坐标系下的道路 GeoDataFrame
+            extent: (minx, miny, maxx, maxy) 需要查询的范围，一般为建筑总范围
+            monitor: 可选的 MemoryMonitor，分配栅格前检查内存预算
+        """
+        self.cfg = config
+        self.resolution = float(config.RASTER_RESOLUTION)
+
+        # 栅格范围外扩 MAX_DISTANCE，保证有效距离内的道路都落在栅格中
+        margin = config.MAX_DISTANCE + self.resolution
+        self.minx = extent[0] - margin
+        self.miny = extent[1] - margin
+        self.n_cols = int(np.ceil((extent[2] + margin - self.minx) / self.resolution))
+        self.n_rows = int(np.ceil((extent[3] + margin - self.miny) / self.resolution))
+
+        if monitor:
+            # 掩膜 1 字节 + 最近像元下标 2 x int32
+            monitor.check_budget("道路栅格化", extra_bytes=self.n_rows * self.n_cols * 9)
+
+        self._rasterize(roads_gdf)
+
+    def _sample_road_points(self, roads_gdf):
+        """沿道路线段按半个像元的步长加密采样，返回 (x, y) 数组及每个点所属道路的位置"""
+        lines = roads_gdf.geometry.reset_index(drop=True).explode(index_parts=False)
+        line_road = lines.index.to_numpy()
+        coords = lines.reset_index(drop=True).get_coordinates()
+        xy = coords[['x', 'y']].to_numpy()
+        part = coords.index.to_numpy()
+
+        # 相邻坐标属于同一条线时构成一条线段
+        same = part[1:] == part[:-1]
+        p0 = xy[:-1][same]
+        p1 = xy[1:][same]
+        if len(p0) == 0:
+            return np.empty((0, 2)), np.empty(0, dtype=np.int64)
+        seg_road = line_road[part[:-1][same]]
+
+        step = self.resolution / 2.0
+        seg_len = np.hypot(p1[:, 0] - p0[:, 0], p1[:, 1] - p0[:, 1])
+        n_pts = np.ceil(seg_len / step).astype(np.int64) + 1
+
+        seg_id = np.repeat(np.arange(len(p0)), n_pts)
+        seg_start = np.repeat(np.cumsum(n_pts) - n_pts, n_pts)
+        t = (np.arange(len(seg_id)) - seg_start) / np.repeat(np.maximum(n_pts - 1, 1), n_pts)
+        return p0[seg_id] + t[:, None] * (p1 - p0)[seg_id], seg_road[seg_id]
+
+    def _to_cells(self, xs, ys):
+        cols = np.floor((xs - self.minx) / self.resolution).astype(np.int64)
+        rows = np.floor((ys - self.miny) / self.resolution).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.n_rows) & (cols >= 0) & (cols < self.n_cols)
+        return rows, cols, inside
+
+    def _rasterize(self, roads_gdf):
+        """生成道路掩膜、道路像元对应的道路点，以及最近道路像元下标"""
+        pts, pts_road = self._sample_road_points(roads_gdf)
+        rows, cols, inside = self._to_cells(pts[:, 0], pts[:, 1])
+        rows, cols, pts, pts_road = rows[inside], cols[inside], pts[inside], pts_road[inside]
+
+        # 每个道路像元保留一个落在其中的道路点，按扁平下标排序以便二分查找
+        flat = rows * self.n_cols + cols
+        self.road_cells, first = np.unique(flat, return_index=True)
+        self.road_points = pts[first]
+        self.road_ids = pts_road[first]
+        print(f"  道路栅格: {self.n_rows} x {self.n_cols} (分辨率 {self.resolution}m)，道路像元 {len(self.road_cells)} 个")
+
+        self.nearest_index = None
+        if len(self.road_cells) == 0:
+            return
+
+        mask = np.ones((self.n_rows, self.n_cols), dtype=bool)
+        mask.flat[self.road_cells] = False
+
+        # 只需最近像元下标，距离由实际坐标重新计算，更精确也省一份浮点栅格
+        self.nearest_index = np.empty((2, self.n_rows, self.n_cols), dtype=np.int32)
+        distance_transform_edt(mask, return_distances=False, return_indices=True, indices=self.nearest_index)
+
+    def query(self, xs, ys):
+        """
+        查询一批点的最近道路点
+
+        Returns:
+            (road_x, road_y, dist, road_idx): road_idx 为最近道路在 roads_gdf 中的位置；
+            栅格范围外或无道路时 dist 为 inf、road_idx 为 -1
+        """
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        road_x = np.full(len(xs), np.nan)
+        road_y = np.full(len(xs), np.nan)
+        dist = np.full(len(xs), np.inf)
+        road_idx = np.full(len(xs), -1, dtype=np.int64)
+        if self.nearest_index is None:
+            return road_x, road_y, dist, road_idx
+
+        rows, cols, inside = self._to_cells(xs, ys)
+        near_rows = self.nearest_index[0, rows[inside], cols[inside]].astype(np.int64)
+        near_cols = self.nearest_index[1, rows[inside], cols[inside]].astype(np.int64)
+        pos = np.searchsorted(self.road_cells, near_rows * self.n_cols + near_cols)
+
+        road_x[inside] = self.road_points[pos, 0]
+        road_y[inside] = self.road_points[pos, 1]
+        road_idx[inside] = self.road_ids[pos]
+        dist[inside] = np.hypot(road_x[inside] - xs[inside], road_y[inside] - ys[inside])
+        return road_x, road_y, dist, road_idx
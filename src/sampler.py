@@ -1,71 +1,210 @@
 import geopandas as gpd
 import pandas as pd
 import numpy as np
+import shapely
 from tqdm import tqdm
 from shapely.ops import nearest_points
-from shapely.geometry import MultiLineString, GeometryCollection
 from .config import Config
-from .geometry_utils import calculate_polygon_edge_midpoints, calculate_heading
+from .geometry_utils import calculate_edge_midpoints_array, calculate_heading, calculate_heading_array
+from .checkpoint import CheckpointManager
+from .geometry_cache import GeometryCache
+from .raster_matcher import RasterRoadMatcher
+
+# 单个建筑采样结果（dict + 2 个 Point）的估算字节数，用于按内存预算选择批次大小
+RESULT_BYTES_PER_BUILDING = 2048
+# 背面剔除每块展开的 (中点, 道路) 配对数上限，及每对的临时数组字节数（下标 3 x int64 + 外包矩形 4 x float64 + 坐标/法向 4 x float64）
+CULL_CHUNK_PAIRS = 1_000_000
+CULL_BYTES_PER_PAIR = 88
 
 
 class Sampler:
-    def __init__(self, config=Config):
+    def __init__(self, config=Config, monitor=None):
         self.cfg = config
+        # 可选的 MemoryMonitor，用于按内存预算选择批次大小和提前失败
+        self.monitor = monitor
+        # 采样时创建的共享几何缓存，供 Visualizer 复用
+        self.cache = None
+        # 按道路位置对齐的等级惩罚数组（米）
+        self.road_penalty = None
 
     def generate_building_midpoints(self, buildings_gdf):
         """
         Step 4: 为所有建筑生成边中点
         """
         print("\n计算建筑各边中点...")
-        all_midpoints = []
-
-        # 使用 itertuples 通常比 iterrows 快
-        # 但为了保持逻辑简单，且需要 geometry，这里用 iterrows 配合 tqdm
-        for idx, row in tqdm(buildings_gdf.iterrows(), total=len(buildings_gdf), desc="  提取中点"):
-            midpoints = calculate_polygon_edge_midpoints(row.geometry)
 
-            # 附加元数据
-            for mp in midpoints:
-                mp['building_id'] = row['building_id']
-                mp['building_area'] = row['area_sqm']  # 顺便带上面积，后续用
-                # mp['building_idx'] = idx # 不需要原始索引，用ID即可
+        # 所有建筑的边一次性向量化计算，避免逐行构造 dict 与 Point
+        edges = calculate_edge_midpoints_array(buildings_gdf.geometry.values)
+        geom_index = edges.pop('geom_index')
+        x, y = edges.pop('x'), edges.pop('y')
 
-            all_midpoints.extend(midpoints)
-
-        # 转换为 GeoDataFrame
         midpoints_gdf = gpd.GeoDataFrame(
-            all_midpoints,
+            {
+                'edge_index': edges['edge_index'],
+                'midpoint': gpd.points_from_xy(x, y),
+                'normal_x': edges['normal_x'],
+                'normal_y': edges['normal_y'],
+                'edge_length': edges['edge_length'],
+                'building_id': buildings_gdf['building_id'].values[geom_index],
+                'building_area': buildings_gdf['area_sqm'].values[geom_index],  # 顺便带上面积，后续用
+            },
             geometry='midpoint',
             crs=buildings_gdf.crs
         )
         print(f"共生成 {len(midpoints_gdf)} 个边中点")
         return midpoints_gdf
 
+    def _road_penalties(self, roads_gdf):
+        """
+        由道路等级编码查得每条道路的距离惩罚
+        查找表末尾为默认惩罚，编码 -1（未列出的类型）恰好取到它
+        """
+        table = np.append(np.asarray(list(self.cfg.ROAD_CLASS_PENALTIES.values()), dtype=float),
+                          float(self.cfg.ROAD_CLASS_DEFAULT_PENALTY))
+        if 'road_class' not in roads_gdf.columns:
+            return np.full(len(roads_gdf), table[-1])
+        return table[roads_gdf['road_class'].to_numpy(dtype=np.int64)]
+
+    def _ensure_cache(self, buildings_gdf, roads_gdf):
+        """取得与当前建筑/道路对应的共享几何缓存，背面剔除与采样共用同一份"""
+        if self.cache is None or self.cache.buildings_gdf is not buildings_gdf or self.cache.roads_gdf is not roads_gdf:
+            self.cache = GeometryCache(buildings_gdf, roads_gdf, config=self.cfg, monitor=self.monitor)
+        return self.cache
+
+    def _build_road_candidates(self, buildings_gdf, roads_gdf):
+        """建立候选道路 CSR，并登记其内存"""
+        cache = self._ensure_cache(buildings_gdf, roads_gdf)
+        if cache.road_pos is None:
+            cache.build_road_candidates()
+            if self.monitor:
+                self.monitor.track("候选道路索引", cache)
+        return cache
+
+    def cull_backfacing_midpoints(self, buildings_gdf, roads_gdf, midpoints_gdf):
+        """
+        Step 4.5: 背面剔除
+        剔除外法向背离缓冲区内所有道路的边中点（如街区内侧的背墙），
+        以道路外包矩形的四个角点作为道路方位的廉价估计：
+        只要有一个角点位于边的正前方半平面，就保留该边
+        """
+        print("\n执行背面剔除...")
+        n_before = len(midpoints_gdf)
+        if n_before == 0 or roads_gdf.empty:
+            return midpoints_gdf
+
+        # 1. 候选道路 CSR（与采样共用）：建筑缓冲区 -> 候选道路位置
+        cache = self._build_road_candidates(buildings_gdf, roads_gdf)
+
+        # 2. 每个中点对应其所属建筑候选道路 CSR 中的一段 [start, start + count)
+        mp_bpos = cache.positions_of(midpoints_gdf['building_id'].values)
+        starts = cache.road_offsets[mp_bpos]
+        counts = cache.road_offsets[mp_bpos + 1] - starts
+        pair_ends = np.cumsum(counts)
+
+        all_mx = midpoints_gdf.geometry.x.values
+        all_my = midpoints_gdf.geometry.y.values
+        all_nx = midpoints_gdf['normal_x'].values
+        all_ny = midpoints_gdf['normal_y'].values
+        road_bounds = roads_gdf.bounds.values  # minx, miny, maxx, maxy
+
+        # 3. 按中点分块展开 (中点, 道路) 配对，每块约 CULL_CHUNK_PAIRS 对，限制临时数组大小
+        keep = np.zeros(n_before, dtype=bool)
+        lo = 0
+        while lo < n_before:
+            pair_base = pair_ends[lo] - counts[lo]
+            hi = max(int(np.searchsorted(pair_ends, pair_base + CULL_CHUNK_PAIRS, side='right')), lo + 1)
+            n_pairs = int(pair_ends[hi - 1] - pair_base)
+            if self.monitor:
+                self.monitor.check_budget(f"背面剔除 [{lo}, {hi})", extra_bytes=n_pairs * CULL_BYTES_PER_PAIR)
+
+            chunk_counts = counts[lo:hi]
+            pair_mp = np.repeat(np.arange(lo, hi), chunk_counts)
+            pair_offset = np.arange(n_pairs) - np.repeat(pair_ends[lo:hi] - chunk_counts - pair_base, chunk_counts)
+            bounds = road_bounds[cache.road_pos[np.repeat(starts[lo:hi], chunk_counts) + pair_offset]]
+
+            # 道路外包矩形角点到中点的向量在外法向上的最大投影；
+            # 投影对 x、y 可分离，逐维取较大者即为四个角点中的最大投影
+            mx, my = all_mx[pair_mp], all_my[pair_mp]
+            nx, ny = all_nx[pair_mp], all_ny[pair_mp]
+            proj_x = np.maximum((bounds[:, 0] - mx) * nx, (bounds[:, 2] - mx) * nx)
+            proj_y = np.maximum((bounds[:, 1] - my) * ny, (bounds[:, 3] - my) * ny)
+
+            # 4. 任意一条道路在前方即保留
+            keep[pair_mp[(proj_x + proj_y) > 0]] = True
+            lo = hi
+
+        culled_gdf = midpoints_gdf[keep].reset_index(drop=True)
+        removed = n_before - len(culled_gdf)
+        print(f"  - 剔除背向道路的边: {removed} ({removed / n_before * 100:.1f}%)")
+        print(f"  - 剩余候选边中点: {len(culled_gdf)}")
+        return culled_gdf
+
     def execute_sampling(self, buildings_gdf, roads_gdf, midpoints_gdf):
         """
         Step 5: 核心采样循环
+        按建筑位置区间分批处理；开启检查点时每批结果落盘，中断后可从断点继续
+        MATCH_MODE 为 'raster' 时改用栅格距离场近似匹配
         """
+        self.road_penalty = self._road_penalties(roads_gdf)
+        if self.cfg.MATCH_MODE == 'raster':
+            return self.execute_raster_sampling(buildings_gdf, roads_gdf, midpoints_gdf)
+
         print("\n开始匹配最近道路采样点...")
 
         results = []
         stats = {'with_roads': 0, 'no_roads': 0, 'too_far': 0}
+        n_buildings = len(buildings_gdf)
 
-        # 建立空间索引 (虽然 intersects 会自动用，但显式调用是个好习惯)
-        sindex = roads_gdf.sindex
+        # 检查点：批次大小以 manifest 为准，保证重启后区间划分一致
+        checkpoint = None
+        if self.cfg.CHECKPOINT_ENABLED:
+            batch_size = self.cfg.CHECKPOINT_BATCH_SIZE
+            if self.monitor:
+                batch_size = self.monitor.suggest_batch_size(RESULT_BYTES_PER_BUILDING, batch_size)
+            fingerprint = CheckpointManager.compute_fingerprint(self.cfg, buildings_gdf, roads_gdf, midpoints_gdf)
+            checkpoint = CheckpointManager(self.cfg, fingerprint, batch_size=batch_size)
+            batch_size = checkpoint.batch_size
+        else:
+            # 结果全部驻留内存：超出预算时提前失败，而不是等到被系统 OOM 终止
+            if self.monitor:
+                self.monitor.check_budget("采样结果", extra_bytes=n_buildings * RESULT_BYTES_PER_BUILDING)
+            batch_size = max(n_buildings, 1)
+
+        # 共享几何缓存：候选道路 CSR 一次批量查询建立，逐建筑处理时只做切片
+        cache = self._build_road_candidates(buildings_gdf, roads_gdf)
+        cache.set_midpoints(midpoints_gdf)
+
+        # 主循环：按批次遍历建筑
+        with tqdm(total=n_buildings, desc="  采样进度") as pbar:
+            for start in range(0, n_buildings, batch_size):
+                end = min(start + batch_size, n_buildings)
+                if checkpoint and checkpoint.is_completed(start, end):
+                    pbar.update(end - start)
+                    continue
 
-        # 主循环：遍历每个建筑
-        for idx, building in tqdm(buildings_gdf.iterrows(), total=len(buildings_gdf), desc="  采样进度"):
-            res = self._process_single_building(building, roads_gdf, midpoints_gdf)
+                batch_results = []
+                for _, building in buildings_gdf.iloc[start:end].iterrows():
+                    res = self._process_single_building(building, roads_gdf, midpoints_gdf)
 
-            if res:
-                results.append(res)
-                stats['with_roads'] += 1
-            else:
-                # 简单统计失败原因（这里简化处理，通常是因为缓冲区没路或距离太远）
-                stats['no_roads'] += 1
+                    if res:
+                        batch_results.append(res)
+                        stats['with_roads'] += 1
+                    else:
+                        # 简单统计失败原因（这里简化处理，通常是因为缓冲区没路或距离太远）
+                        stats['no_roads'] += 1
+                    pbar.update(1)
+                    if self.monitor:
+                        self.monitor.raise_if_exceeded(f"采样批次 [{start}, {end})")
+
+                if checkpoint:
+                    checkpoint.save_batch(start, end, batch_results)
+                else:
+                    results.extend(batch_results)
+                if self.monitor:
+                    self.monitor.check_budget(f"采样批次 [{start}, {end})")
 
         # 创建结果 DataFrame
-        results_df = pd.DataFrame(results)
+        results_df = checkpoint.load_results() if checkpoint else pd.DataFrame(results)
 
         print(f"采样完成")
         print(f"  - 成功采样: {len(results_df)} ({len(results_df) / len(buildings_gdf) * 100:.1f}%)")
@@ -73,63 +212,157 @@ class Sampler:
 
         return results_df
 
+    def execute_raster_sampling(self, buildings_gdf, roads_gdf, midpoints_gdf):
+        """
+        Step 5 (近似模式): 栅格距离场匹配
+        所有边中点的最近道路点与距离由查表一次性得到，按建筑取距离最小的边；
+        可选对选中的边做精确最近点修正，并抽样与精确模式对比误差
+        """
+        print("\n开始近似匹配最近道路采样点 (栅格距离场)...")
+        # 近似模式不需要候选道路 CSR，只登记中点供 Visualizer 使用
+        self._ensure_cache(buildings_gdf, roads_gdf).set_midpoints(midpoints_gdf)
+        matcher = RasterRoadMatcher(roads_gdf, buildings_gdf.total_bounds, config=self.cfg, monitor=self.monitor)
+
+        # 1. 批量查表
+        mx = midpoints_gdf.geometry.x.values
+        my = midpoints_gdf.geometry.y.values
+        road_x, road_y, dist, road_idx = matcher.query(mx, my)
+
+        # 2. 每个建筑取 距离 + 最近道路等级惩罚 最小的边
+        candidates = pd.DataFrame({
+            'building_id': midpoints_gdf['building_id'].values,
+            'mp_pos': np.arange(len(midpoints_gdf)),
+            'dist': dist
+        })
+        valid = np.isfinite(dist) & (dist <= self.cfg.MAX_DISTANCE)
+
+        # 与精确模式一致，只处理 BUFFER_DISTANCE 内有道路的建筑：
+        # 道路距某条边不超过 BUFFER_DISTANCE 时，该边中点到最近道路不超过 BUFFER_DISTANCE + 半个边长
+        edge_length = midpoints_gdf['edge_length'].values if 'edge_length' in midpoints_gdf.columns else 0.0
+        near = np.isfinite(dist) & (dist <= self.cfg.BUFFER_DISTANCE + edge_length / 2.0)
+        in_buffer = pd.Series(near).groupby(midpoints_gdf['building_id'].values).transform('any').values
+        valid &= in_buffer
+
+        score = np.full(len(dist), np.inf)
+        score[valid] = dist[valid] + self.road_penalty[road_idx[valid]]
+        candidates['score'] = score
+        candidates = candidates[valid]
+        best = candidates.loc[candidates.groupby('building_id', sort=False)['score'].idxmin()]
+        pos = best['mp_pos'].values
+        sx, sy, best_dist = road_x[pos], road_y[pos], best['dist'].values
+
+        # 3. 可选：只对选中的边做精确最近点修正
+        if self.cfg.RASTER_REFINE and len(pos) > 0:
+            sx, sy, best_dist = self._refine_nearest(mx[pos], my[pos], road_idx[pos], roads_gdf)
+
+        valid = best_dist <= self.cfg.MAX_DISTANCE
+        pos, sx, sy, best_dist = pos[valid], sx[valid], sy[valid], best_dist[valid]
+        building_ids = best['building_id'].values[valid]
+
+        # 4. 组装结果，字段与精确模式一致，按建筑原始顺序排列
+        b_pos = self.cache.positions_of(building_ids)
+        area = buildings_gdf['area_sqm'].values[b_pos]
+        results_df = pd.DataFrame({
+            'building_id': building_ids,
+            'lat': sy,  # 注意：这里还是投影坐标，后续统一转经纬度
+            'lng': sx,
+            'heading': calculate_heading_array(sx, sy, mx[pos], my[pos]),
+            'distance': np.round(best_dist, 2),
+            'confidence': np.round(np.maximum(0, 100 - best_dist), 2),
+            'edge_index': midpoints_gdf['edge_index'].values[pos],
+            'building_area': area,
+            'geometry_sample': gpd.points_from_xy(sx, sy),
+            'geometry_midpoint': midpoints_gdf.geometry.values[pos]
+        })
+        order = np.argsort(b_pos, kind='stable')
+        results_df = results_df.iloc[order].reset_index(drop=True)
+
+        print(f"采样完成")
+        print(f"  - 成功采样: {len(results_df)} ({len(results_df) / len(buildings_gdf) * 100:.1f}%)")
+        print(f"  - 未找到合适点: {len(buildings_gdf) - len(results_df)}")
+
+        if self.cfg.RASTER_ERROR_SAMPLE_SIZE:
+            self._report_raster_error(results_df, buildings_gdf, roads_gdf, midpoints_gdf)
+
+        return results_df
+
+    def _refine_nearest(self, xs, ys, ranked_roads, roads_gdf):
+        """
+        对选中的边中点，在排序胜出的道路上精确计算最近点
+        只用胜出的道路而非附近任意道路，避免修正时落到被等级惩罚排除的道路上
+        """
+        points = gpd.points_from_xy(xs, ys)
+        lines = shapely.shortest_line(np.asarray(points), np.asarray(roads_gdf.geometry.values[ranked_roads]))
+        road_end = shapely.get_coordinates(shapely.get_point(lines, 1))
+        dist = np.hypot(road_end[:, 0] - xs, road_end[:, 1] - ys)
+        return road_end[:, 0], road_end[:, 1], dist
+
+    def _report_raster_error(self, results_df, buildings_gdf, roads_gdf, midpoints_gdf):
+        """抽样运行精确模式，报告近似模式的误差"""
+        n_sample = min(self.cfg.RASTER_ERROR_SAMPLE_SIZE, len(buildings_gdf))
+        sample = buildings_gdf.sample(n=n_sample, random_state=self.cfg.RANDOM_SEED)
+        print(f"\n抽样 {n_sample} 个建筑对比精确模式...")
+
+        exact = [self._process_single_building(b, roads_gdf, midpoints_gdf) for _, b in sample.iterrows()]
+        exact_df = pd.DataFrame([r for r in exact if r])
+        approx_df = results_df[results_df['building_id'].isin(sample['building_id'])]
+
+        exact_ids = set(exact_df['building_id']) if not exact_df.empty else set()
+        approx_ids = set(approx_df['building_id'])
+        print(f"  - 成功采样: 精确 {len(exact_ids)} / 近似 {len(approx_ids)}")
+        print(f"  - 两者均成功: {len(exact_ids & approx_ids)}, "
+              f"仅精确成功: {len(exact_ids - approx_ids)}, 仅近似成功: {len(approx_ids - exact_ids)}")
+        if not (exact_ids & approx_ids):
+            return
+
+        merged = exact_df.merge(approx_df, on='building_id', suffixes=('_exact', '_approx'))
+        dist_err = (merged['distance_approx'] - merged['distance_exact']).abs()
+        pos_err = np.hypot(merged['lng_approx'] - merged['lng_exact'], merged['lat_approx'] - merged['lat_exact'])
+        same_edge = (merged['edge_index_approx'] == merged['edge_index_exact']).mean() * 100
+
+        print(f"  - 选中同一条边: {same_edge:.1f}%")
+        print(f"  - 距离误差 (米): 平均 {dist_err.mean():.2f}, P95 {dist_err.quantile(0.95):.2f}, 最大 {dist_err.max():.2f}")
+        print(f"  - 采样点偏移 (米): 平均 {pos_err.mean():.2f}, P95 {pos_err.quantile(0.95):.2f}, 最大 {pos_err.max():.2f}")
+
     def _process_single_building(self, building, roads_gdf, all_midpoints_gdf):
         """处理单个建筑的采样逻辑"""
 
-        # 1. 获取该建筑的所有中点
-        # 优化：这里每次查询全量 midpoints_gdf 可能较慢
-        # 但由于 midpoints_gdf 已经是构建好的，用 pandas 筛选尚可
-        # 极致优化是将 midpoints 按 building_id 分组存储在 dict 中，但先保持原逻辑
-        b_midpoints = all_midpoints_gdf[all_midpoints_gdf['building_id'] == building['building_id']]
+        # 1. 获取该建筑的所有中点 (按 building_id 预先分组，避免逐建筑全表筛选)
+        b_midpoints = self.cache.get_midpoints(building['building_id'])
 
         if len(b_midpoints) == 0:
             return None
 
-        # 2. 空间查询：找到缓冲区内的道路
-        buffer = building.geometry.buffer(self.cfg.BUFFER_DISTANCE)
-        possible_roads_idx = list(roads_gdf.sindex.query(buffer, predicate='intersects'))
+        # 2. 缓冲区内的道路：从候选道路 CSR 切片 (sindex 的 intersects 谓词已是精确判断)
+        possible_roads_idx = self.cache.get_road_candidates(building['building_id'])
 
-        if not possible_roads_idx:
+        if len(possible_roads_idx) == 0:
             return None
 
-        nearby_roads = roads_gdf.iloc[possible_roads_idx]
-        # 精确裁剪 (intersect)
-        road_clip = nearby_roads[nearby_roads.intersects(buffer)]
+        road_clip = roads_gdf.iloc[possible_roads_idx]
+
+        # 3. 批量计算 边中点 x 候选道路 的距离矩阵
+        mp_geoms = np.asarray(b_midpoints['midpoint'].values)
+        road_geoms = np.asarray(road_clip.geometry.values)
+        dist_matrix = shapely.distance(mp_geoms[:, None], road_geoms[None, :])
 
-        if road_clip.empty:
+        # 4. 以 距离 + 道路等级惩罚 排序，超出最大有效距离的组合不参与排序
+        penalties = self.road_penalty[possible_roads_idx]
+        scores = np.where(dist_matrix <= self.cfg.MAX_DISTANCE, dist_matrix + penalties[None, :], np.inf)
+        best_flat = np.argmin(scores)
+        if not np.isfinite(scores.flat[best_flat]):
             return None
 
-        # 3. 合并道路几何以进行最近点计算
-        # unary_union 有时比 GeometryCollection 鲁棒，但这里 Collection 够快
-        road_geoms = road_clip.geometry.values
-        if len(road_geoms) == 1:
-            road_union = road_geoms[0]
-        else:
-            road_union = GeometryCollection(list(road_geoms))
-
-        # 4. 遍历该建筑所有边中点，找全局最近点
-        best_sample = None
-        min_dist = float('inf')
-
-        for _, mp_row in b_midpoints.iterrows():
-            mp_geom = mp_row['midpoint']
-
-            # 找道路上最近的点
-            # nearest_points 返回 (geom1_nearest, geom2_nearest)
-            try:
-                p_road = nearest_points(mp_geom, road_union)[1]
-                dist = mp_geom.distance(p_road)
-
-                if dist < min_dist:
-                    min_dist = dist
-                    best_sample = {
-                        'sample_point': p_road,
-                        'building_midpoint': mp_geom,
-                        'edge_index': mp_row['edge_index'],
-                        'dist': dist
-                    }
-            except Exception:
-                continue
+        # 只对胜出的 (边中点, 道路) 组合求精确最近点
+        i, j = np.unravel_index(best_flat, scores.shape)
+        mp_geom = mp_geoms[i]
+        p_road = nearest_points(mp_geom, road_geoms[j])[1]
+        best_sample = {
+            'sample_point': p_road,
+            'building_midpoint': mp_geom,
+            'edge_index': b_midpoints['edge_index'].values[i],
+            'dist': dist_matrix[i, j]
+        }
 
         # 5. 最终校验
         if best_sample and best_sample['dist'] <= self.cfg.MAX_DISTANCE:
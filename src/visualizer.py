@@ -6,7 +6,7 @@ import matplotlib.pyplot as plt
 import folium
 from shapely.geometry import Point, MultiPolygon, Polygon
 from .config import Config
-from .geometry_utils import calculate_polygon_edge_midpoints  # 引入计算工具
+from .geometry_cache import GeometryCache
 
 # 设置 matplotlib 中文支持
 plt.rcParams['font.sans-serif'] = ['SimHei', 'DejaVu Sans', 'Arial Unicode MS']
@@ -130,11 +130,11 @@ class Visualizer:
             print("  缺少样本数据，跳过简化对比图生成。")
             return
 
-        # 确保按 ID 排序以对应
-        original_gdf = original_gdf.sort_values('building_id')
-        simplified_gdf = simplified_gdf.sort_values('building_id')
+        # 按 ID 建立几何映射，避免逐个样本全表筛选
+        original_geoms = dict(zip(original_gdf['building_id'].values, original_gdf.geometry.values))
+        simplified_geoms = dict(zip(simplified_gdf['building_id'].values, simplified_gdf.geometry.values))
 
-        ids = original_gdf['building_id'].values
+        ids = np.sort(original_gdf['building_id'].values)
         fig, axes = plt.subplots(1, len(ids), figsize=(6 * len(ids), 6))
         if len(ids) == 1: axes = [axes]  # 兼容只有1个样本的情况
 
@@ -146,30 +146,30 @@ class Visualizer:
             return 0
 
         for ax, bid in zip(axes, ids):
-            orig_row = original_gdf[original_gdf['building_id'] == bid].iloc[0]
-            simp_row = simplified_gdf[simplified_gdf['building_id'] == bid].iloc[0]
+            orig_geom = original_geoms[bid]
+            simp_geom = simplified_geoms[bid]
 
             # 统计顶点
-            v_orig = get_vertex_count(orig_row.geometry)
-            v_simp = get_vertex_count(simp_row.geometry)
+            v_orig = get_vertex_count(orig_geom)
+            v_simp = get_vertex_count(simp_geom)
             reduction = (1 - v_simp / v_orig) * 100
 
             # 绘制原始（蓝色实线）
-            if orig_row.geometry.geom_type == 'MultiPolygon':
-                for poly in orig_row.geometry.geoms:
+            if orig_geom.geom_type == 'MultiPolygon':
+                for poly in orig_geom.geoms:
                     x, y = poly.exterior.xy
                     ax.plot(x, y, 'b-', linewidth=3, alpha=0.5, label='Original')
             else:
-                x, y = orig_row.geometry.exterior.xy
+                x, y = orig_geom.exterior.xy
                 ax.plot(x, y, 'b-', linewidth=3, alpha=0.5, label='Original')
 
             # 绘制简化（红色虚线）
-            if simp_row.geometry.geom_type == 'MultiPolygon':
-                for poly in simp_row.geometry.geoms:
+            if simp_geom.geom_type == 'MultiPolygon':
+                for poly in simp_geom.geoms:
                     x, y = poly.exterior.xy
                     ax.plot(x, y, 'r--', linewidth=2, label='Simplified')
             else:
-                x, y = simp_row.geometry.exterior.xy
+                x, y = simp_geom.exterior.xy
                 ax.plot(x, y, 'r--', linewidth=2, label='Simplified')
 
             ax.set_title(f"Building #{bid}\n顶点: {v_orig} → {v_simp} (Reduced {reduction:.1f}%)")
@@ -189,14 +189,18 @@ class Visualizer:
     # 采样详情图
     # =========================================================================
     def plot_detailed_samples(self, results_df, buildings_gdf, roads_gdf,
-                              output_filename="streetview_samples_examples.png"):
+                              output_filename="streetview_samples_examples.png", cache=None):
         """
         绘制详细的采样示意图
-        特点：保持特写视角，仅显示视野内的道路片段，标出所有边中点
+        特点：保持特写视角，仅显示视野内的道路片段，标出所有候选边中点
+        Args:
+            cache: 采样阶段创建的 GeometryCache (Sampler.cache)，从中切片取中点与候选道路；为 None 时临时创建
         """
         print("\n正在生成采样详情图...")
 
         if results_df.empty: return
+        if cache is None:
+            cache = GeometryCache(buildings_gdf, roads_gdf, config=self.cfg)
 
         # 随机选择 3 个采样结果
         sample_indices = np.random.choice(len(results_df), size=min(3, len(results_df)), replace=False)
@@ -209,7 +213,7 @@ class Visualizer:
             bid = row['building_id']
 
             # 1. 获取核心几何对象
-            building_geom = buildings_gdf[buildings_gdf['building_id'] == bid].geometry.iloc[0]
+            building_geom = cache.get_geometry(bid)
             sample_pt = row['geometry_sample']  # 采样点 Point
             target_pt = row['geometry_midpoint']  # 目标中点 Point
 
@@ -226,11 +230,9 @@ class Visualizer:
             view_xlim = (minx - padding, maxx + padding)
             view_ylim = (miny - padding, maxy + padding)
 
-            # 3. 获取并裁剪附近的道路 (用于背景)
-            # 先用一个稍微大一点的 buffer 查路，确保路不断开
-            search_buffer = building_geom.buffer(self.cfg.BUFFER_DISTANCE)
-            possible_roads_idx = list(roads_gdf.sindex.query(search_buffer, predicate='intersects'))
-            nearby_roads = roads_gdf.iloc[possible_roads_idx]
+            # 3. 获取附近的道路 (用于背景)
+            # 复用采样时缓冲区查询得到的候选道路，确保路不断开
+            nearby_roads = roads_gdf.iloc[cache.get_road_candidates(bid)]
 
             # --- 开始绘图 ---
 
@@ -249,10 +251,9 @@ class Visualizer:
                 ax.fill(x, y, '#E1F5FE', alpha=1.0, edgecolor='#0277BD', linewidth=2, zorder=2)
 
             # C. 绘制所有候选边中点 (灰色小空心点)
-            # 实时计算该建筑的所有中点
-            all_midpoints = calculate_polygon_edge_midpoints(building_geom)
-            mx = [m['midpoint'].x for m in all_midpoints]
-            my = [m['midpoint'].y for m in all_midpoints]
+            all_midpoints = cache.get_midpoints(bid)['midpoint'].values
+            mx = [m.x for m in all_midpoints]
+            my = [m.y for m in all_midpoints]
             ax.scatter(mx, my, c='white', edgecolors='gray', s=35, zorder=3, label='Edges', marker='o', linewidth=1)
 
             # D. 绘制选定的最佳中点 (红色实心点)